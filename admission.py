@@ -0,0 +1,189 @@
+"""Control de admisión por grupo de rutas.
+
+Cada grupo (subidas, escrituras, lecturas, sincronizacion) tiene su propio límite de
+peticiones simultáneas y una cola de espera acotada. Si la cola está llena o
+la espera supera el plazo, la petición se rechaza con 503 + Retry-After en vez
+de acumularse hasta agotar las conexiones a la BD.
+
+El límite se ajusta solo (AIMD): sube de poco en poco mientras la latencia
+está por debajo del objetivo y baja un 10% cuando lo supera.
+"""
+import asyncio
+import collections
+import math
+import time
+
+from fastapi import Request
+from fastapi.responses import JSONResponse
+
+
+class LimitadorAdaptativo:
+    def __init__(self, nombre, limite_inicial, limite_min, limite_max,
+                 max_cola, espera_max, latencia_objetivo):
+        self.nombre = nombre
+        self.limite = float(limite_inicial)
+        self.limite_min = limite_min
+        self.limite_max = limite_max
+        self.max_cola = max_cola
+        self.espera_max = espera_max
+        self.latencia_objetivo = latencia_objetivo
+        self.latencia_media = latencia_objetivo / 2
+        self.en_curso = 0
+        self._cola = collections.deque()
+        self._ultima_bajada = 0.0
+
+    def _hay_hueco(self) -> bool:
+        return self.en_curso < int(self.limite)
+
+    async def entrar(self) -> bool:
+        """Espera un hueco. Devuelve False si la petición se debe rechazar."""
+        if self._hay_hueco() and not self._cola:
+            self.en_curso += 1
+            return True
+        if len(self._cola) >= self.max_cola:
+            return False
+
+        hueco = asyncio.get_running_loop().create_future()
+        self._cola.append(hueco)
+        try:
+            await asyncio.wait_for(hueco, self.espera_max)
+            return True
+        except asyncio.TimeoutError:
+            # _despertar() puede haber dado el hueco (en_curso += 1) en la misma
+            # vuelta del bucle en que vence el plazo; en 3.12+ wait_for lanza
+            # TimeoutError igualmente. Se admite para no perder el hueco.
+            if hueco.done() and not hueco.cancelled():
+                return True
+            return False
+        except asyncio.CancelledError:
+            # El cliente se ha ido; si ya se le había dado hueco hay que soltarlo
+            if hueco.done() and not hueco.cancelled():
+                self.en_curso -= 1
+                self._despertar()
+            raise
+        finally:
+            if not hueco.done() or hueco.cancelled():
+                try:
+                    self._cola.remove(hueco)
+                except ValueError:
+                    pass
+
+    def salir(self, latencia: float):
+        self.en_curso -= 1
+        self._ajustar(latencia)
+        self._despertar()
+
+    def _ajustar(self, latencia: float):
+        self.latencia_media = 0.8 * self.latencia_media + 0.2 * latencia
+        ahora = time.monotonic()
+        if self.latencia_media > self.latencia_objetivo:
+            # Como mucho una bajada por intervalo para no hundir el límite de golpe
+            if ahora - self._ultima_bajada >= self.latencia_objetivo:
+                self.limite = max(self.limite_min, self.limite * 0.9)
+                self._ultima_bajada = ahora
+        else:
+            # +1 aproximadamente cada vez que se completa un "límite" de peticiones
+            self.limite = min(self.limite_max, self.limite + 1 / self.limite)
+
+    def _despertar(self):
+        while self._cola and self._hay_hueco():
+            hueco = self._cola.popleft()
+            if hueco.done():
+                continue
+            self.en_curso += 1
+            hueco.set_result(True)
+
+    def retry_after(self) -> int:
+        """Segundos estimados hasta que haya hueco."""
+        tandas = (len(self._cola) + 1) / max(1, int(self.limite))
+        return max(1, math.ceil(tandas * self.latencia_media))
+
+    def estado(self) -> dict:
+        return {
+            "limite": int(self.limite),
+            "en_curso": self.en_curso,
+            "en_cola": len(self._cola),
+            "latencia_media": round(self.latencia_media, 3),
+        }
+
+
+LIMITADORES = {
+    "subidas": LimitadorAdaptativo(
+        "subidas", limite_inicial=4, limite_min=1, limite_max=8,
+        max_cola=16, espera_max=10.0, latencia_objetivo=5.0
+    ),
+    "escrituras": LimitadorAdaptativo(
+        "escrituras", limite_inicial=10, limite_min=2, limite_max=30,
+        max_cola=50, espera_max=2.0, latencia_objetivo=0.5
+    ),
+    "lecturas": LimitadorAdaptativo(
+        "lecturas", limite_inicial=20, limite_min=4, limite_max=60,
+        max_cola=100, espera_max=1.0, latencia_objetivo=0.2
+    ),
+    # /sync va aparte: una primera sincronización tarda segundos y tiene una
+    # conexión al primario abierta mientras dura; no debe rebajar el límite
+    # de las lecturas normales
+    "sincronizacion": LimitadorAdaptativo(
+        "sincronizacion", limite_inicial=4, limite_min=1, limite_max=10,
+        max_cola=20, espera_max=5.0, latencia_objetivo=5.0
+    ),
+}
+
+
+def grupo_de(request: Request):
+    """Grupo de rutas de la petición, o None si no pasa por el control."""
+    path = request.url.path
+    if path == "/" or path.startswith("/static"):
+        return None
+    if path == "/sync":
+        return "sincronizacion"
+    content_type = request.headers.get("content-type", "")
+    if path.startswith("/upload") or content_type.startswith("multipart/form-data"):
+        return "subidas"
+    if request.method in ("GET", "HEAD"):
+        return "lecturas"
+    return "escrituras"
+
+
+async def controlar_admision(request: Request, call_next):
+    """Middleware HTTP: aplica el limitador del grupo de la petición."""
+    grupo = grupo_de(request)
+    if grupo is None:
+        return await call_next(request)
+
+    limitador = LIMITADORES[grupo]
+    if not await limitador.entrar():
+        return JSONResponse(
+            status_code=503,
+            content={"detail": "Servidor saturado, inténtalo más tarde"},
+            headers={"Retry-After": str(limitador.retry_after())}
+        )
+
+    inicio = time.monotonic()
+    soltado = False
+
+    def soltar():
+        nonlocal soltado
+        if not soltado:
+            soltado = True
+            limitador.salir(time.monotonic() - inicio)
+
+    try:
+        response = await call_next(request)
+    except BaseException:
+        soltar()
+        raise
+
+    # call_next vuelve en cuanto hay cabeceras; con respuestas en streaming
+    # (p. ej. /sync) el hueco se suelta cuando termina de enviarse el cuerpo
+    cuerpo = response.body_iterator
+
+    async def cuerpo_controlado():
+        try:
+            async for trozo in cuerpo:
+                yield trozo
+        finally:
+            soltar()
+
+    response.body_iterator = cuerpo_controlado()
+    return response
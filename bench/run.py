@@ -0,0 +1,381 @@
+"""Reproduce tráfico contra la app de main.py y mide su rendimiento.
+
+    DB_PRIMARY=127.0.0.1:3307 DB_USER=root DB_PASSWORD=bench \\
+        python -m bench.run --perfil mixto --duracion 30 --concurrencia 20
+
+La app corre en el mismo proceso (httpx + ASGITransport, sin red ni
+uvicorn), contra la BD local llenada con bench.seed. Para cada perfil informa
+de peticiones/s, latencias p50/p95/p99 y consultas a la BD por petición.
+Con --max-p95 / --max-consultas sale con código 1 si se superan, para usarlo
+antes de desplegar. Al terminar cada perfil deshace lo que ha escrito en la
+BD y borra las imágenes subidas. Necesita httpx instalado.
+"""
+import argparse
+import asyncio
+import contextvars
+import json
+import os
+import random
+import statistics
+import time
+
+import httpx
+
+import db_connection
+
+TAMANO_IMAGEN = 200 * 1024
+
+# Contador de la petición en curso: {"conexiones": n, "consultas": n}
+_contador = contextvars.ContextVar("contador_bd", default=None)
+
+
+class _CursorContado:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, *args, **kwargs):
+        _sumar("consultas")
+        return self._cursor.execute(*args, **kwargs)
+
+    def executemany(self, *args, **kwargs):
+        _sumar("consultas")
+        return self._cursor.executemany(*args, **kwargs)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, nombre):
+        return getattr(self._cursor, nombre)
+
+
+class _ConexionContada:
+    def __init__(self, conn):
+        self._conn = conn
+
+    def cursor(self, *args, **kwargs):
+        return _CursorContado(self._conn.cursor(*args, **kwargs))
+
+    def commit(self):
+        _sumar("consultas")
+        return self._conn.commit()
+
+    def __getattr__(self, nombre):
+        return getattr(self._conn, nombre)
+
+
+def _sumar(clave):
+    contador = _contador.get()
+    if contador is not None:
+        contador[clave] += 1
+
+
+def _instrumentar_bd():
+    """Envuelve las conexiones de db_connection para contar idas a la BD."""
+    conectar = db_connection._conectar
+
+    def conectar_contado(destino):
+        _sumar("conexiones")
+        return _ConexionContada(conectar(destino))
+
+    db_connection._conectar = conectar_contado
+
+
+def _app_contada(app, resultados):
+    """ASGI que da a cada petición su propio contador."""
+    async def envoltorio(scope, receive, send):
+        if scope["type"] != "http":
+            return await app(scope, receive, send)
+        contador = {"conexiones": 0, "consultas": 0}
+        _contador.set(contador)
+        try:
+            await app(scope, receive, send)
+        finally:
+            resultados.append(contador)
+    return envoltorio
+
+
+def _fotos_publicaciones():
+    """foto_publicacion actual de las publicaciones que tienen una."""
+    conn = db_connection.get_db()
+    if not conn:
+        raise SystemExit("Error de conexión a la BD")
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT id_publicacion, foto_publicacion FROM Publicaciones "
+        "WHERE foto_publicacion IS NOT NULL"
+    )
+    fotos = dict(cursor.fetchall())
+    cursor.close()
+    conn.close()
+    return fotos
+
+
+def _restaurar_fotos(fotos, ids_publicacion):
+    """Deja foto_publicacion como estaba antes de las subidas del benchmark."""
+    if not ids_publicacion:
+        return
+    conn = db_connection.get_db()
+    if not conn:
+        raise SystemExit("Error de conexión a la BD")
+    cursor = conn.cursor()
+    cursor.executemany(
+        "UPDATE Publicaciones SET foto_publicacion = %s WHERE id_publicacion = %s",
+        [(fotos.get(i), i) for i in ids_publicacion]
+    )
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+
+# Tablas en las que escriben los perfiles: lo que pase de su id máximo antes
+# de la ejecución se borra al terminar
+TABLAS_ESCRITAS = [("MeGusta", "id_megusta"), ("Mensajes", "id_mensaje"), ("Cambios", "id_cambio")]
+
+
+def _ids_maximos():
+    conn = db_connection.get_db()
+    if not conn:
+        raise SystemExit("Error de conexión a la BD")
+    cursor = conn.cursor()
+    maximos = {}
+    for tabla, columna in TABLAS_ESCRITAS:
+        cursor.execute(f"SELECT COALESCE(MAX({columna}), 0) FROM {tabla}")
+        maximos[tabla] = cursor.fetchone()[0]
+    cursor.close()
+    conn.close()
+    return maximos
+
+
+def _borrar_filas_nuevas(maximos):
+    """Borra las filas creadas durante la ejecución y reajusta los AUTO_INCREMENT."""
+    conn = db_connection.get_db()
+    if not conn:
+        raise SystemExit("Error de conexión a la BD")
+    cursor = conn.cursor()
+    for tabla, columna in TABLAS_ESCRITAS:
+        cursor.execute(f"DELETE FROM {tabla} WHERE {columna} > %s", (maximos[tabla],))
+        conn.commit()
+        cursor.execute(f"ALTER TABLE {tabla} AUTO_INCREMENT = {maximos[tabla] + 1}")
+    cursor.close()
+    conn.close()
+
+
+def _rangos():
+    """Ids máximos de la BD sembrada, para generar peticiones válidas."""
+    conn = db_connection.get_db()
+    if not conn:
+        raise SystemExit("Error de conexión a la BD")
+    cursor = conn.cursor()
+    rangos = {}
+    for tabla, columna in [("Usuarios", "id_usuario"), ("Publicaciones", "id_publicacion")]:
+        cursor.execute(f"SELECT COALESCE(MAX({columna}), 0) FROM {tabla}")
+        rangos[tabla] = cursor.fetchone()[0]
+    cursor.close()
+    conn.close()
+    if not all(rangos.values()):
+        raise SystemExit("La BD está vacía; ejecuta antes python -m bench.seed")
+    return rangos
+
+
+# PETICIONES: cada una recibe (rnd, rangos, estado del cliente) y devuelve
+# (método, url, kwargs)
+def _usuario(rnd, r):
+    return rnd.randint(1, r["Usuarios"])
+
+
+def _publicacion(rnd, r):
+    # Como en bench.seed: parte del tráfico va a las publicaciones más populares
+    if rnd.random() < 0.3:
+        return min(r["Publicaciones"], int(rnd.paretovariate(1.2)))
+    return rnd.randint(1, r["Publicaciones"])
+
+
+def ver_detalle(rnd, r, estado):
+    return "GET", f"/publicaciones/{_publicacion(rnd, r)}/detalle", {
+        "params": {"id_usuario": _usuario(rnd, r)}}
+
+
+def ver_publicacion(rnd, r, estado):
+    return "GET", f"/publicaciones/{_publicacion(rnd, r)}", {}
+
+
+def ver_usuario(rnd, r, estado):
+    return "GET", f"/usuarios/{_usuario(rnd, r)}", {}
+
+
+def ver_megusta(rnd, r, estado):
+    return "GET", f"/megusta/{_publicacion(rnd, r)}", {}
+
+
+def dar_megusta(rnd, r, estado):
+    return "POST", "/megusta/", {"json": {
+        "id_publicacion": _publicacion(rnd, r), "id_usuario": _usuario(rnd, r)}}
+
+
+def subir_foto(rnd, r, estado):
+    imagen = rnd.randbytes(TAMANO_IMAGEN)
+    return "POST", f"/upload/post/{_publicacion(rnd, r)}", {
+        "files": {"file": ("bench.jpg", imagen, "image/jpeg")}}
+
+
+def ver_bandeja(rnd, r, estado):
+    return "GET", f"/mensajes/{_usuario(rnd, r)}", {}
+
+
+def enviar_mensaje(rnd, r, estado):
+    return "POST", "/mensajes/", {"json": {
+        "id_emisor": _usuario(rnd, r), "id_receptor": _usuario(rnd, r),
+        "contenido": "mensaje de benchmark"}}
+
+
+def sincronizar(rnd, r, estado):
+    # Como la app: cada cliente es un usuario que reenvía el token de su última
+    # sincronización (la primera, sin token, es completa)
+    estado.setdefault("id_usuario", _usuario(rnd, r))
+    params = {"id_usuario": estado["id_usuario"]}
+    if estado.get("token") is not None:
+        params["since"] = estado["token"]
+    return "GET", "/sync", {"params": params}
+
+
+# Perfil -> [(peso, petición)]
+PERFILES = {
+    "feed": [(60, ver_detalle), (20, ver_publicacion), (20, ver_usuario)],
+    "megusta": [(80, dar_megusta), (20, ver_megusta)],
+    "subidas": [(100, subir_foto)],
+    "bandeja": [(70, ver_bandeja), (20, enviar_mensaje), (10, sincronizar)],
+}
+PERFILES["mixto"] = (
+    [(p * 5, f) for p, f in PERFILES["feed"]]
+    + [(p * 2, f) for p, f in PERFILES["megusta"]]
+    + [(p * 2, f) for p, f in PERFILES["bandeja"]]
+    + [(p, f) for p, f in PERFILES["subidas"]]
+)
+
+
+def _percentil(valores, p):
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+
+
+async def ejecutar_perfil(app, perfil, rangos, duracion, concurrencia, semilla):
+    pesos, peticiones = zip(*PERFILES[perfil])
+    contadores = []
+    latencias = []
+    estados = {}
+    subidas = []
+    publicaciones_tocadas = set()
+    fotos = _fotos_publicaciones() if perfil in ("subidas", "mixto") else {}
+    maximos = _ids_maximos()
+    transport = httpx.ASGITransport(app=_app_contada(app, contadores))
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        fin = time.monotonic() + duracion
+
+        async def cliente(n):
+            rnd = random.Random(semilla * 1000 + n)
+            headers = {"X-Cliente-Id": f"bench-{n}"}
+            estado = {}
+            while time.monotonic() < fin:
+                peticion = rnd.choices(peticiones, weights=pesos)[0]
+                metodo, url, kwargs = peticion(rnd, rangos, estado)
+                if url.startswith("/upload"):
+                    # Antes de enviarla: aunque falle, el UPDATE puede haberse hecho
+                    publicaciones_tocadas.add(int(url.rsplit("/", 1)[-1]))
+                inicio = time.perf_counter()
+                respuesta = await client.request(metodo, url, headers=headers, **kwargs)
+                await respuesta.aread()
+                latencias.append(time.perf_counter() - inicio)
+                estados[respuesta.status_code] = estados.get(respuesta.status_code, 0) + 1
+                if url.startswith("/upload") and respuesta.status_code == 200:
+                    subidas.append(respuesta.json()["image_url"])
+                elif url == "/sync" and respuesta.status_code == 200:
+                    estado["token"] = json.loads(respuesta.text.splitlines()[-1])["token"]
+                elif url == "/sync" and respuesta.status_code == 410:
+                    estado["token"] = None
+
+        inicio = time.monotonic()
+        try:
+            await asyncio.gather(*[cliente(n) for n in range(concurrencia)])
+        finally:
+            # La ejecución no debe dejar rastro para que la siguiente mida la misma
+            # BD: se borran los me gusta, mensajes y cambios nuevos, se restauran
+            # las fotos de las publicaciones y se borran los ficheros subidos
+            _borrar_filas_nuevas(maximos)
+            _restaurar_fotos(fotos, publicaciones_tocadas)
+            from consultes import POST_IMAGES_DIR, delete_image
+            for url in subidas:
+                delete_image(POST_IMAGES_DIR, url.rsplit("/", 1)[-1])
+        transcurrido = time.monotonic() - inicio
+
+    consultas = [c["consultas"] for c in contadores]
+    return {
+        "perfil": perfil,
+        "peticiones": len(latencias),
+        "peticiones_s": round(len(latencias) / transcurrido, 1),
+        "p50_ms": round(_percentil(latencias, 50) * 1000, 1),
+        "p95_ms": round(_percentil(latencias, 95) * 1000, 1),
+        "p99_ms": round(_percentil(latencias, 99) * 1000, 1),
+        "consultas_media": round(statistics.mean(consultas), 2) if consultas else 0,
+        "consultas_max": max(consultas, default=0),
+        "conexiones_media": round(
+            statistics.mean(c["conexiones"] for c in contadores), 2) if contadores else 0,
+        "estados": estados,
+    }
+
+
+def _imprimir(informes):
+    columnas = ["perfil", "peticiones", "peticiones_s", "p50_ms", "p95_ms", "p99_ms",
+                "consultas_media", "consultas_max", "conexiones_media"]
+    print(" | ".join(f"{c:>16}" for c in columnas) + " | estados")
+    for informe in informes:
+        print(" | ".join(f"{informe[c]!s:>16}" for c in columnas) + f" | {informe['estados']}")
+
+
+async def main(args):
+    if db_connection.PRIMARIO["host"] == db_connection.HOST_PRODUCCION:
+        raise SystemExit("DB_PRIMARY apunta a producción; configura una BD local")
+
+    _instrumentar_bd()
+    # main.py monta static/ relativo al directorio actual
+    os.makedirs("static", exist_ok=True)
+    from main import app
+
+    rangos = _rangos()
+    perfiles = list(PERFILES) if args.perfil == "todos" else [args.perfil]
+    informes = []
+    for perfil in perfiles:
+        informes.append(await ejecutar_perfil(
+            app, perfil, rangos, args.duracion, args.concurrencia, args.semilla
+        ))
+
+    if args.json:
+        print(json.dumps(informes, indent=2))
+    else:
+        _imprimir(informes)
+
+    fallos = []
+    for informe in informes:
+        if args.max_p95 and informe["p95_ms"] > args.max_p95:
+            fallos.append(f"{informe['perfil']}: p95 {informe['p95_ms']} ms > {args.max_p95}")
+        if args.max_consultas and informe["consultas_max"] > args.max_consultas:
+            fallos.append(f"{informe['perfil']}: {informe['consultas_max']} consultas "
+                          f"> {args.max_consultas}")
+    if fallos:
+        print("\n".join(f"❌ {f}" for f in fallos))
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de la API de PetMatch")
+    parser.add_argument("--perfil", choices=[*PERFILES, "todos"], default="mixto")
+    parser.add_argument("--duracion", type=float, default=30, help="segundos por perfil")
+    parser.add_argument("--concurrencia", type=int, default=20, help="clientes simultáneos")
+    parser.add_argument("--semilla", type=int, default=42)
+    parser.add_argument("--json", action="store_true", help="salida en JSON")
+    parser.add_argument("--max-p95", type=float, help="falla si algún p95 supera estos ms")
+    parser.add_argument("--max-consultas", type=int,
+                        help="falla si alguna petición hace más consultas a la BD")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,99 @@
+-- Esquema de PetMatch para la BD local de los benchmarks.
+-- Reconstruido a partir de las consultas de consultes.py; NO usar contra producción.
+
+DROP TABLE IF EXISTS Cambios;
+DROP TABLE IF EXISTS Productos;
+DROP TABLE IF EXISTS Categorias;
+DROP TABLE IF EXISTS MeGusta;
+DROP TABLE IF EXISTS Adopciones;
+DROP TABLE IF EXISTS Mensajes;
+DROP TABLE IF EXISTS Comentarios;
+DROP TABLE IF EXISTS Publicaciones;
+DROP TABLE IF EXISTS Mascotas;
+DROP TABLE IF EXISTS Usuarios;
+
+CREATE TABLE Usuarios (
+    id_usuario INT AUTO_INCREMENT PRIMARY KEY,
+    nombre VARCHAR(100) NOT NULL,
+    email VARCHAR(150) NOT NULL,
+    contraseña VARCHAR(255) NOT NULL,
+    tipo_usuario VARCHAR(20) NOT NULL,
+    codigo_postal VARCHAR(10) NULL,
+    foto_usuario VARCHAR(255) NULL,
+    INDEX idx_usuarios_email (email)
+);
+
+CREATE TABLE Mascotas (
+    id_mascota INT AUTO_INCREMENT PRIMARY KEY,
+    nombre VARCHAR(100) NOT NULL,
+    especie VARCHAR(50) NOT NULL,
+    raza VARCHAR(50) NULL,
+    edad INT NOT NULL,
+    id_usuario INT NOT NULL,
+    FOREIGN KEY (id_usuario) REFERENCES Usuarios(id_usuario)
+);
+
+CREATE TABLE Publicaciones (
+    id_publicacion INT AUTO_INCREMENT PRIMARY KEY,
+    id_usuario INT NOT NULL,
+    contenido TEXT NOT NULL,
+    fecha_publicacion DATETIME NOT NULL,
+    foto_publicacion VARCHAR(255) NULL,
+    FOREIGN KEY (id_usuario) REFERENCES Usuarios(id_usuario)
+);
+
+CREATE TABLE Comentarios (
+    id_comentario INT AUTO_INCREMENT PRIMARY KEY,
+    id_publicacion INT NOT NULL,
+    id_usuario INT NOT NULL,
+    contenido TEXT NOT NULL,
+    fecha_comentario DATETIME NOT NULL,
+    FOREIGN KEY (id_publicacion) REFERENCES Publicaciones(id_publicacion),
+    FOREIGN KEY (id_usuario) REFERENCES Usuarios(id_usuario)
+);
+
+CREATE TABLE Mensajes (
+    id_mensaje INT AUTO_INCREMENT PRIMARY KEY,
+    id_emisor INT NOT NULL,
+    id_receptor INT NOT NULL,
+    contenido TEXT NOT NULL,
+    fecha_envio DATETIME NOT NULL,
+    FOREIGN KEY (id_emisor) REFERENCES Usuarios(id_usuario),
+    FOREIGN KEY (id_receptor) REFERENCES Usuarios(id_usuario)
+);
+
+CREATE TABLE Adopciones (
+    id_adopcion INT AUTO_INCREMENT PRIMARY KEY,
+    id_mascota INT NOT NULL,
+    id_usuario_adoptante INT NOT NULL,
+    fecha_adopcion DATE NOT NULL,
+    FOREIGN KEY (id_mascota) REFERENCES Mascotas(id_mascota),
+    FOREIGN KEY (id_usuario_adoptante) REFERENCES Usuarios(id_usuario)
+);
+
+CREATE TABLE MeGusta (
+    id_megusta INT AUTO_INCREMENT PRIMARY KEY,
+    id_publicacion INT NOT NULL,
+    id_usuario INT NOT NULL,
+    fecha DATETIME NOT NULL,
+    FOREIGN KEY (id_publicacion) REFERENCES Publicaciones(id_publicacion),
+    FOREIGN KEY (id_usuario) REFERENCES Usuarios(id_usuario)
+);
+
+CREATE TABLE Categorias (
+    id_categoria INT AUTO_INCREMENT PRIMARY KEY,
+    nombre VARCHAR(100) NOT NULL
+);
+
+CREATE TABLE Productos (
+    id_producto INT AUTO_INCREMENT PRIMARY KEY,
+    nombre VARCHAR(150) NOT NULL,
+    descripcion TEXT NOT NULL,
+    precio DECIMAL(10, 2) NOT NULL,
+    imagen VARCHAR(255) NULL,
+    id_usuario_empresa INT NOT NULL,
+    id_categoria INT NOT NULL,
+    link_externo VARCHAR(255) NULL,
+    FOREIGN KEY (id_usuario_empresa) REFERENCES Usuarios(id_usuario),
+    FOREIGN KEY (id_categoria) REFERENCES Categorias(id_categoria)
+);
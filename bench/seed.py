@@ -0,0 +1,159 @@
+"""Crea el esquema y llena la BD local de los benchmarks con datos de prueba.
+
+    DB_PRIMARY=127.0.0.1:3307 DB_USER=root DB_PASSWORD=bench python -m bench.seed --escala 1
+
+Borra y vuelve a crear todas las tablas, así que se niega a correr contra el
+host de producción. Con la misma --semilla genera siempre los mismos datos.
+"""
+import argparse
+import datetime
+import glob
+import os
+import random
+
+import db_connection
+
+TAMANO_LOTE = 1000
+
+# Filas por tabla con --escala 1
+VOLUMENES = {
+    "Usuarios": 2000,
+    "Mascotas": 3000,
+    "Publicaciones": 10000,
+    "Comentarios": 30000,
+    "MeGusta": 60000,
+    "Mensajes": 20000,
+    "Categorias": 20,
+    "Productos": 500,
+}
+
+ESPECIES = ["perro", "gato", "conejo", "hurón", "pájaro"]
+PALABRAS = ("adopción paseo parque cachorro veterinario pienso juguete "
+            "collar refugio vacuna playa siesta correa arnés premio").split()
+
+
+def _texto(rnd, min_palabras, max_palabras):
+    return " ".join(rnd.choice(PALABRAS) for _ in range(rnd.randint(min_palabras, max_palabras)))
+
+
+def _fecha(rnd, ahora):
+    return ahora - datetime.timedelta(seconds=rnd.randint(0, 365 * 24 * 3600))
+
+
+def _insertar(conn, query, filas):
+    cursor = conn.cursor()
+    for i in range(0, len(filas), TAMANO_LOTE):
+        cursor.executemany(query, filas[i:i + TAMANO_LOTE])
+        conn.commit()
+    cursor.close()
+
+
+def _ejecutar_sql(cursor, ruta):
+    with open(ruta, encoding="utf-8") as f:
+        sentencias = f.read().split(";")
+    for sentencia in sentencias:
+        lineas = [l for l in sentencia.splitlines() if not l.strip().startswith("--")]
+        if "".join(lineas).strip():
+            cursor.execute("\n".join(lineas))
+
+
+def crear_esquema(conn):
+    """schema.sql y después las migraciones del repo, en orden."""
+    raiz = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    rutas = [os.path.join(raiz, "bench", "schema.sql")]
+    rutas += sorted(glob.glob(os.path.join(raiz, "migraciones", "*.sql")))
+    cursor = conn.cursor()
+    for ruta in rutas:
+        _ejecutar_sql(cursor, ruta)
+    conn.commit()
+    cursor.close()
+
+
+def sembrar(conn, escala: float, semilla: int):
+    rnd = random.Random(semilla)
+    ahora = datetime.datetime.now()
+    n = {tabla: max(1, int(v * escala)) for tabla, v in VOLUMENES.items()}
+    usuario = lambda: rnd.randint(1, n["Usuarios"])
+
+    _insertar(conn, """
+        INSERT INTO Usuarios (nombre, email, contraseña, tipo_usuario, codigo_postal, foto_usuario)
+        VALUES (%s, %s, %s, %s, %s, %s)
+    """, [
+        (f"usuario{i}", f"usuario{i}@petmatch.test", "bench",
+         "empresa" if i % 50 == 0 else "particular",
+         f"{rnd.randint(1000, 52999):05d}", None)
+        for i in range(1, n["Usuarios"] + 1)
+    ])
+    _insertar(conn, """
+        INSERT INTO Mascotas (nombre, especie, raza, edad, id_usuario)
+        VALUES (%s, %s, %s, %s, %s)
+    """, [
+        (f"mascota{i}", rnd.choice(ESPECIES), None, rnd.randint(0, 15), usuario())
+        for i in range(n["Mascotas"])
+    ])
+    _insertar(conn, """
+        INSERT INTO Publicaciones (id_usuario, contenido, fecha_publicacion, foto_publicacion)
+        VALUES (%s, %s, %s, %s)
+    """, [
+        (usuario(), _texto(rnd, 5, 40), _fecha(rnd, ahora), None)
+        for _ in range(n["Publicaciones"])
+    ])
+
+    # Comentarios y me gusta concentrados en pocas publicaciones, como en la realidad
+    def publicacion():
+        if rnd.random() < 0.3:
+            return min(n["Publicaciones"], int(rnd.paretovariate(1.2)))
+        return rnd.randint(1, n["Publicaciones"])
+    _insertar(conn, """
+        INSERT INTO Comentarios (id_publicacion, id_usuario, contenido, fecha_comentario)
+        VALUES (%s, %s, %s, %s)
+    """, [
+        (publicacion(), usuario(), _texto(rnd, 2, 20), _fecha(rnd, ahora))
+        for _ in range(n["Comentarios"])
+    ])
+    _insertar(conn, """
+        INSERT INTO MeGusta (id_publicacion, id_usuario, fecha)
+        VALUES (%s, %s, %s)
+    """, [
+        (publicacion(), usuario(), _fecha(rnd, ahora))
+        for _ in range(n["MeGusta"])
+    ])
+    _insertar(conn, """
+        INSERT INTO Mensajes (id_emisor, id_receptor, contenido, fecha_envio)
+        VALUES (%s, %s, %s, %s)
+    """, [
+        (usuario(), usuario(), _texto(rnd, 2, 30), _fecha(rnd, ahora))
+        for _ in range(n["Mensajes"])
+    ])
+    _insertar(conn, "INSERT INTO Categorias (nombre) VALUES (%s)", [
+        (f"categoria{i}",) for i in range(n["Categorias"])
+    ])
+    empresas = [i for i in range(1, n["Usuarios"] + 1) if i % 50 == 0] or [1]
+    _insertar(conn, """
+        INSERT INTO Productos
+        (nombre, descripcion, precio, imagen, id_usuario_empresa, id_categoria, link_externo)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+    """, [
+        (f"producto{i}", _texto(rnd, 5, 25), round(rnd.uniform(1, 200), 2), None,
+         rnd.choice(empresas), rnd.randint(1, n["Categorias"]), None)
+        for i in range(n["Productos"])
+    ])
+    return n
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Llena la BD local de benchmarks")
+    parser.add_argument("--escala", type=float, default=1.0,
+                        help="multiplica los volúmenes por defecto")
+    parser.add_argument("--semilla", type=int, default=42)
+    args = parser.parse_args()
+
+    if db_connection.PRIMARIO["host"] == db_connection.HOST_PRODUCCION:
+        raise SystemExit("DB_PRIMARY apunta a producción; configura una BD local")
+
+    conn = db_connection.get_db()
+    if not conn:
+        raise SystemExit("Error de conexión a la BD")
+    crear_esquema(conn)
+    print(sembrar(conn, args.escala, args.semilla))
+    conn.close()
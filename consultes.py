@@ -1,5 +1,6 @@
-from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Depends
-from db_connection import get_db
+from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Depends, Query
+from db_connection import get_db, get_db_lectura
+from delta_sync import TABLAS as TABLAS_SYNC, registrar_cambios
 from pydantic import BaseModel
 import datetime
 import os
@@ -9,6 +10,7 @@ import os
 import uuid
 from pathlib import Path
 import aiofiles
+import jobs
 
 router = APIRouter()
 # Configuración flexible
@@ -92,6 +94,105 @@ async def save_image(file: UploadFile, directory: str = None) -> str:
         print(f"❌ Error al guardar imagen: {str(e)}")
         raise
 
+def delete_image(directory: str, filename: Optional[str]):
+    """Borra una imagen guardada con save_image; si ya no existe no pasa nada"""
+    if not filename:
+        return
+    try:
+        os.remove(os.path.join(directory, os.path.basename(filename)))
+    except FileNotFoundError:
+        pass
+
+# BORRADOS EN CASCADA (se ejecutan en segundo plano con jobs)
+TAMANO_LOTE = 500
+
+def _borrar_por_lotes(conn, tabla, columna_id, where, params, columna_imagen=None, directorio=None):
+    """Borra las filas que cumplen `where` en lotes, con un commit por lote.
+
+    Si se indica columna_imagen, también borra del disco las imágenes de las
+    filas eliminadas. Devuelve el número de filas borradas.
+    """
+    columnas = columna_id if not columna_imagen else f"{columna_id}, {columna_imagen}"
+    borradas = 0
+    cursor = conn.cursor()
+    while True:
+        cursor.execute(
+            f"SELECT {columnas} FROM {tabla} WHERE {where} LIMIT %s",
+            (*params, TAMANO_LOTE)
+        )
+        filas = cursor.fetchall()
+        if not filas:
+            break
+        ids = [fila[0] for fila in filas]
+        if tabla in TABLAS_SYNC:
+            registrar_cambios(cursor, tabla, ids, "delete")
+        placeholders = ", ".join(["%s"] * len(ids))
+        cursor.execute(f"DELETE FROM {tabla} WHERE {columna_id} IN ({placeholders})", ids)
+        conn.commit()
+        borradas += len(ids)
+        if columna_imagen:
+            for fila in filas:
+                delete_image(directorio, fila[1])
+    cursor.close()
+    return borradas
+
+@jobs.handler("eliminar_publicacion")
+def _job_eliminar_publicacion(id_publicacion: int):
+    conn = get_db()
+    if not conn:
+        raise RuntimeError("Error de conexión a la BD")
+    try:
+        borradas = {
+            "MeGusta": _borrar_por_lotes(
+                conn, "MeGusta", "id_megusta", "id_publicacion = %s", (id_publicacion,)
+            ),
+            "Comentarios": _borrar_por_lotes(
+                conn, "Comentarios", "id_comentario", "id_publicacion = %s", (id_publicacion,)
+            ),
+            "Publicaciones": _borrar_por_lotes(
+                conn, "Publicaciones", "id_publicacion", "id_publicacion = %s", (id_publicacion,),
+                columna_imagen="foto_publicacion", directorio=POST_IMAGES_DIR
+            ),
+        }
+    finally:
+        conn.close()
+    return borradas
+
+@jobs.handler("eliminar_usuario")
+def _job_eliminar_usuario(id_usuario: int):
+    conn = get_db()
+    if not conn:
+        raise RuntimeError("Error de conexión a la BD")
+
+    # El orden importa: primero las filas que apuntan a otras (FKs)
+    publicaciones_usuario = "SELECT id_publicacion FROM Publicaciones WHERE id_usuario = %s"
+    mascotas_usuario = "SELECT id_mascota FROM Mascotas WHERE id_usuario = %s"
+    pasos = [
+        ("MeGusta", "id_megusta",
+         f"id_usuario = %s OR id_publicacion IN ({publicaciones_usuario})", 2, None, None),
+        ("Comentarios", "id_comentario",
+         f"id_usuario = %s OR id_publicacion IN ({publicaciones_usuario})", 2, None, None),
+        ("Publicaciones", "id_publicacion",
+         "id_usuario = %s", 1, "foto_publicacion", POST_IMAGES_DIR),
+        ("Mensajes", "id_mensaje",
+         "id_emisor = %s OR id_receptor = %s", 2, None, None),
+        ("Adopciones", "id_adopcion",
+         f"id_usuario_adoptante = %s OR id_mascota IN ({mascotas_usuario})", 2, None, None),
+        ("Mascotas", "id_mascota", "id_usuario = %s", 1, None, None),
+        ("Productos", "id_producto", "id_usuario_empresa = %s", 1, None, None),
+        ("Usuarios", "id_usuario", "id_usuario = %s", 1, "foto_usuario", PROFILE_IMAGES_DIR),
+    ]
+    borradas = {}
+    try:
+        for tabla, columna_id, where, n_params, columna_imagen, directorio in pasos:
+            borradas[tabla] = _borrar_por_lotes(
+                conn, tabla, columna_id, where, (id_usuario,) * n_params,
+                columna_imagen=columna_imagen, directorio=directorio
+            )
+    finally:
+        conn.close()
+    return borradas
+
 # ENDPOINTS PARA IMÁGENES
 @router.post("/upload/profile/{user_id}")
 async def upload_profile_image(
@@ -171,7 +272,7 @@ async def crear_usuario(
 
 @router.get("/usuarios/{id_usuario}")
 def obtener_usuario(id_usuario: int):
-    conn = get_db()
+    conn = get_db_lectura()
     if not conn:
         raise HTTPException(status_code=500, detail="Error de conexión a la BD")
     
@@ -230,20 +331,12 @@ async def actualizar_usuario(
     
     return {"mensaje": "Usuario actualizado correctamente"}
 
-@router.delete("/usuarios/{id_usuario}")
+@router.delete("/usuarios/{id_usuario}", status_code=202)
 def eliminar_usuario(id_usuario: int):
-    conn = get_db()
-    if not conn:
-        raise HTTPException(status_code=500, detail="Error de conexión a la BD")
-    
-    cursor = conn.cursor()
-    query = "DELETE FROM Usuarios WHERE id_usuario = %s"
-    cursor.execute(query, (id_usuario,))
-    conn.commit()
-    cursor.close()
-    conn.close()
+    # Se borran también sus mascotas, publicaciones, mensajes... en segundo plano
+    id_trabajo = jobs.encolar("eliminar_usuario", {"id_usuario": id_usuario})
 
-    return {"mensaje": "Usuario eliminado correctamente"}
+    return {"mensaje": "Eliminación de usuario en curso", "id_trabajo": id_trabajo}
 
 # ENDPOINTS PARA MASCOTAS
 @router.post("/mascotas/")
@@ -262,6 +355,7 @@ def crear_mascota(mascota: Mascota):
         mascota.nombre, mascota.especie, 
         mascota.raza, mascota.edad, mascota.id_usuario
     ))
+    registrar_cambios(cursor, "Mascotas", [cursor.lastrowid], "upsert")
     conn.commit()
     cursor.close()
     conn.close()
@@ -270,7 +364,7 @@ def crear_mascota(mascota: Mascota):
 
 @router.get("/mascotas/{id_mascota}")
 def obtener_mascota(id_mascota: int):
-    conn = get_db()
+    conn = get_db_lectura()
     if not conn:
         raise HTTPException(status_code=500, detail="Error de conexión a la BD")
     
@@ -302,6 +396,7 @@ def actualizar_mascota(id_mascota: int, mascota: Mascota):
         mascota.nombre, mascota.especie, 
         mascota.raza, mascota.edad, id_mascota
     ))
+    registrar_cambios(cursor, "Mascotas", [id_mascota], "upsert")
     conn.commit()
     cursor.close()
     conn.close()
@@ -316,6 +411,7 @@ def eliminar_mascota(id_mascota: int):
     
     cursor = conn.cursor()
     query = "DELETE FROM Mascotas WHERE id_mascota = %s"
+    registrar_cambios(cursor, "Mascotas", [id_mascota], "delete")
     cursor.execute(query, (id_mascota,))
     conn.commit()
     cursor.close()
@@ -356,7 +452,7 @@ async def crear_publicacion(
 
 @router.get("/publicaciones/{id_publicacion}")
 def obtener_publicacion(id_publicacion: int):
-    conn = get_db()
+    conn = get_db_lectura()
     if not conn:
         raise HTTPException(status_code=500, detail="Error de conexión a la BD")
     
@@ -372,6 +468,120 @@ def obtener_publicacion(id_publicacion: int):
 
     return publicacion
 
+def _pagina_comentarios(cursor, id_publicacion: int, despues_de: int, limite: int) -> dict:
+    """Una página de comentarios con su autor, en una sola consulta.
+
+    Se pide una fila de más para saber si hay página siguiente.
+    """
+    query = """
+        SELECT c.id_comentario, c.id_publicacion, c.contenido, c.fecha_comentario,
+               u.id_usuario, u.nombre, u.foto_usuario
+        FROM Comentarios c
+        LEFT JOIN Usuarios u ON u.id_usuario = c.id_usuario
+        WHERE c.id_publicacion = %s AND c.id_comentario > %s
+        ORDER BY c.id_comentario
+        LIMIT %s
+    """
+    cursor.execute(query, (id_publicacion, despues_de, limite + 1))
+    filas = cursor.fetchall()
+
+    comentarios = [
+        {
+            "id_comentario": fila["id_comentario"],
+            "id_publicacion": fila["id_publicacion"],
+            "contenido": fila["contenido"],
+            "fecha_comentario": fila["fecha_comentario"],
+            "autor": {
+                "id_usuario": fila["id_usuario"],
+                "nombre": fila["nombre"],
+                "foto_usuario": fila["foto_usuario"]
+            }
+        }
+        for fila in filas[:limite]
+    ]
+    siguiente = comentarios[-1]["id_comentario"] if len(filas) > limite else None
+
+    return {"comentarios": comentarios, "siguiente": siguiente}
+
+@router.get("/publicaciones/{id_publicacion}/detalle")
+def obtener_detalle_publicacion(
+    id_publicacion: int,
+    id_usuario: Optional[int] = None,
+    limite_comentarios: int = Query(20, ge=1, le=100)
+):
+    """Publicación con autor, me gusta y primera página de comentarios.
+
+    Son siempre dos consultas, haya los comentarios que haya. `id_usuario`
+    es el usuario que mira la publicación (para `megusta_usuario`).
+    """
+    conn = get_db_lectura()
+    if not conn:
+        raise HTTPException(status_code=500, detail="Error de conexión a la BD")
+    
+    cursor = conn.cursor(dictionary=True)
+    query = """
+        SELECT p.*,
+               u.nombre AS autor_nombre, u.foto_usuario AS autor_foto,
+               (SELECT COUNT(*) FROM MeGusta m
+                WHERE m.id_publicacion = p.id_publicacion) AS num_megusta,
+               EXISTS(SELECT 1 FROM MeGusta m
+                      WHERE m.id_publicacion = p.id_publicacion
+                      AND m.id_usuario = %s) AS megusta_usuario,
+               (SELECT COUNT(*) FROM Comentarios c
+                WHERE c.id_publicacion = p.id_publicacion) AS num_comentarios
+        FROM Publicaciones p
+        LEFT JOIN Usuarios u ON u.id_usuario = p.id_usuario
+        WHERE p.id_publicacion = %s
+    """
+    cursor.execute(query, (id_usuario, id_publicacion))
+    publicacion = cursor.fetchone()
+
+    if not publicacion:
+        cursor.close()
+        conn.close()
+        raise HTTPException(status_code=404, detail="Publicación no encontrada")
+
+    pagina = _pagina_comentarios(cursor, id_publicacion, 0, limite_comentarios)
+    cursor.close()
+    conn.close()
+
+    autor = {
+        "id_usuario": publicacion["id_usuario"],
+        "nombre": publicacion.pop("autor_nombre"),
+        "foto_usuario": publicacion.pop("autor_foto")
+    }
+    num_megusta = publicacion.pop("num_megusta")
+    megusta_usuario = bool(publicacion.pop("megusta_usuario"))
+    num_comentarios = publicacion.pop("num_comentarios")
+
+    return {
+        "publicacion": publicacion,
+        "autor": autor,
+        "num_megusta": num_megusta,
+        "megusta_usuario": megusta_usuario,
+        "num_comentarios": num_comentarios,
+        "comentarios": pagina["comentarios"],
+        "siguiente_comentarios": pagina["siguiente"]
+    }
+
+@router.get("/publicaciones/{id_publicacion}/comentarios")
+def obtener_comentarios_publicacion(
+    id_publicacion: int,
+    despues_de: int = 0,
+    limite: int = Query(20, ge=1, le=100)
+):
+    """Comentarios de una publicación paginados por id (usar `siguiente` como `despues_de`)."""
+    conn = get_db_lectura()
+    if not conn:
+        raise HTTPException(status_code=500, detail="Error de conexión a la BD")
+    
+    cursor = conn.cursor(dictionary=True)
+    pagina = _pagina_comentarios(cursor, id_publicacion, despues_de, limite)
+    cursor.close()
+    conn.close()
+
+    return pagina
+
 @router.put("/publicaciones/{id_publicacion}")
 async def actualizar_publicacion(
     id_publicacion: int,
@@ -407,20 +617,12 @@ async def actualizar_publicacion(
     
     return {"mensaje": "Publicación actualizada correctamente"}
 
-@router.delete("/publicaciones/{id_publicacion}")
+@router.delete("/publicaciones/{id_publicacion}", status_code=202)
 def eliminar_publicacion(id_publicacion: int):
-    conn = get_db()
-    if not conn:
-        raise HTTPException(status_code=500, detail="Error de conexión a la BD")
-    
-    cursor = conn.cursor()
-    query = "DELETE FROM Publicaciones WHERE id_publicacion = %s"
-    cursor.execute(query, (id_publicacion,))
-    conn.commit()
-    cursor.close()
-    conn.close()
+    # Se borran también sus comentarios, me gusta y la imagen en segundo plano
+    id_trabajo = jobs.encolar("eliminar_publicacion", {"id_publicacion": id_publicacion})
 
-    return {"mensaje": "Publicación eliminada correctamente"}
+    return {"mensaje": "Eliminación de publicación en curso", "id_trabajo": id_trabajo}
 
 # ENDPOINTS PARA COMENTARIOS
 @router.post("/comentarios/")
@@ -481,6 +683,7 @@ def enviar_mensaje(mensaje: Mensaje):
         mensaje.contenido, 
         datetime.datetime.now()
     ))
+    registrar_cambios(cursor, "Mensajes", [cursor.lastrowid], "upsert")
     conn.commit()
     cursor.close()
     conn.close()
@@ -489,7 +692,7 @@ def enviar_mensaje(mensaje: Mensaje):
 
 @router.get("/mensajes/{id_receptor}")
 def obtener_mensajes(id_receptor: int):
-    conn = get_db()
+    conn = get_db_lectura()
     if not conn:
         raise HTTPException(status_code=500, detail="Error de conexión a la BD")
     
@@ -510,6 +713,7 @@ def eliminar_mensaje(id_mensaje: int):
     
     cursor = conn.cursor()
     query = "DELETE FROM Mensajes WHERE id_mensaje = %s"
+    registrar_cambios(cursor, "Mensajes", [id_mensaje], "delete")
     cursor.execute(query, (id_mensaje,))
     conn.commit()
     cursor.close()
@@ -543,7 +747,7 @@ def crear_adopcion(adopcion: Adopcion):
 
 @router.get("/adopciones/{id_mascota}")
 def obtener_adopciones_mascota(id_mascota: int):
-    conn = get_db()
+    conn = get_db_lectura()
     if not conn:
         raise HTTPException(status_code=500, detail="Error de conexión a la BD")
     
@@ -597,7 +801,7 @@ def crear_megusta(megusta: MeGusta):
 
 @router.get("/megusta/{id_publicacion}")
 def obtener_megusta_publicacion(id_publicacion: int):
-    conn = get_db()
+    conn = get_db_lectura()
     if not conn:
         raise HTTPException(status_code=500, detail="Error de conexión a la BD")
     
@@ -635,6 +839,7 @@ def crear_categoria(categoria: Categoria):
     cursor = conn.cursor()
     query = "INSERT INTO Categorias (nombre) VALUES (%s)"
     cursor.execute(query, (categoria.nombre,))
+    registrar_cambios(cursor, "Categorias", [cursor.lastrowid], "upsert")
     conn.commit()
     cursor.close()
     conn.close()
@@ -643,7 +848,7 @@ def crear_categoria(categoria: Categoria):
 
 @router.get("/categorias/")
 def obtener_categorias():
-    conn = get_db()
+    conn = get_db_lectura()
     if not conn:
         raise HTTPException(status_code=500, detail="Error de conexión a la BD")
     
@@ -664,6 +869,7 @@ def eliminar_categoria(id_categoria: int):
     
     cursor = conn.cursor()
     query = "DELETE FROM Categorias WHERE id_categoria = %s"
+    registrar_cambios(cursor, "Categorias", [id_categoria], "delete")
     cursor.execute(query, (id_categoria,))
     conn.commit()
     cursor.close()
@@ -693,6 +899,7 @@ def crear_producto(producto: Producto):
         producto.id_categoria,
         producto.link_externo
     ))
+    registrar_cambios(cursor, "Productos", [cursor.lastrowid], "upsert")
     conn.commit()
     cursor.close()
     conn.close()
@@ -701,7 +908,7 @@ def crear_producto(producto: Producto):
 
 @router.get("/productos/{id_categoria}")
 def obtener_productos_por_categoria(id_categoria: int):
-    conn = get_db()
+    conn = get_db_lectura()
     if not conn:
         raise HTTPException(status_code=500, detail="Error de conexión a la BD")
     
@@ -736,6 +943,7 @@ def actualizar_producto(id_producto: int, producto: Producto):
         producto.link_externo, 
         id_producto
     ))
+    registrar_cambios(cursor, "Productos", [id_producto], "upsert")
     conn.commit()
     cursor.close()
     conn.close()
@@ -750,6 +958,7 @@ def eliminar_producto(id_producto: int):
     
     cursor = conn.cursor()
     query = "DELETE FROM Productos WHERE id_producto = %s"
+    registrar_cambios(cursor, "Productos", [id_producto], "delete")
     cursor.execute(query, (id_producto,))
     conn.commit()
     cursor.close()
@@ -757,10 +966,19 @@ def eliminar_producto(id_producto: int):
 
     return {"mensaje": "Producto eliminado correctamente"}
 
+# ENDPOINTS PARA TRABAJOS EN SEGUNDO PLANO
+@router.get("/trabajos/{id_trabajo}")
+def obtener_trabajo(id_trabajo: str):
+    trabajo = jobs.obtener_trabajo(id_trabajo)
+    if not trabajo:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+
+    return trabajo
+
 # ENDPOINT PARA INICIAR SESIÓN
 @router.get("/login/")
 def login(correo: str, contraseña: str):
-    conn = get_db()
+    conn = get_db_lectura()
     if not conn:
         raise HTTPException(status_code=500, detail="Error de conexión a la BD")
     
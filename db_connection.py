@@ -1,14 +1,192 @@
+import contextvars
+import os
+import threading
+import time
+import uuid
 import mysql.connector
 
+# Configuración por variables de entorno para poder apuntar a otras BDs
+# (réplicas, o una BD local para pruebas). Los hosts van como "host[:puerto]".
+HOST_PRODUCCION = "192.168.14.3"
+DB_PRIMARY = os.environ.get("DB_PRIMARY", HOST_PRODUCCION)
+DB_REPLICAS = os.environ.get("DB_REPLICAS", "")
+DB_USER = os.environ.get("DB_USER", "DEV_PPV")
+DB_PASSWORD = os.environ.get("DB_PASSWORD", "DetMatchPPV")
+DB_NAME = os.environ.get("DB_NAME", "PetMatch")
+
+# Tras escribir, las lecturas del mismo cliente van al primario durante este tiempo
+STICKY_SEGUNDOS = float(os.environ.get("DB_STICKY_SEGUNDOS", "5"))
+# Réplicas con más retraso que esto se dejan de usar hasta que se recuperen
+MAX_RETRASO_SEGUNDOS = int(os.environ.get("DB_MAX_RETRASO_SEGUNDOS", "10"))
+INTERVALO_SALUD_SEGUNDOS = float(os.environ.get("DB_INTERVALO_SALUD_SEGUNDOS", "15"))
+# Sin esto una réplica que descarta paquetes tarda lo que el timeout TCP del SO
+# en dar error, y mientras tanto se cuelgan las lecturas y la comprobación de salud
+TIMEOUT_CONEXION_SEGUNDOS = int(os.environ.get("DB_TIMEOUT_CONEXION_SEGUNDOS", "2"))
+# Tiempo que una réplica que ha fallado al conectar queda fuera
+EXPULSION_SEGUNDOS = 30
+
+
+def _parse_host(valor: str) -> dict:
+    host, _, puerto = valor.strip().partition(":")
+    return {"host": host, "port": int(puerto) if puerto else 3306}
+
+
+PRIMARIO = _parse_host(DB_PRIMARY)
+REPLICAS = [_parse_host(h) for h in DB_REPLICAS.split(",") if h.strip()]
+
+# Cliente de la petición en curso; lo fija el middleware de main.py
+cliente_actual = contextvars.ContextVar("cliente_actual", default=None)
+
+_ultima_escritura = {}
+_expulsadas_hasta = {}
+_siguiente_replica = 0
+_lock = threading.Lock()
+_parar_salud = threading.Event()
+
+
+def _conectar(destino: dict):
+    opciones = {}
+    if destino is not PRIMARIO:
+        opciones["connection_timeout"] = TIMEOUT_CONEXION_SEGUNDOS
+    return mysql.connector.connect(
+        host=destino["host"],
+        port=destino["port"],
+        user=DB_USER,
+        password=DB_PASSWORD,
+        database=DB_NAME,
+        **opciones
+    )
+
+
 def get_db():
+    """Conexión al primario. Usar para cualquier escritura."""
     try:
-        connection = mysql.connector.connect(
-            host="192.168.14.3",
-            user="DEV_PPV",
-            password="DetMatchPPV",
-            database="PetMatch"
-        )
+        connection = _conectar(PRIMARIO)
         return connection
     except mysql.connector.Error as e:
         print(f"Error al conectar con la base de datos: {e}")
         return None
+
+
+def _nombre(destino: dict) -> str:
+    return f"{destino['host']}:{destino['port']}"
+
+
+def _expulsar(destino: dict, motivo: str):
+    with _lock:
+        _expulsadas_hasta[_nombre(destino)] = time.monotonic() + EXPULSION_SEGUNDOS
+    print(f"⚠️ Réplica {_nombre(destino)} fuera de servicio: {motivo}")
+
+
+def _replicas_disponibles() -> list:
+    """Réplicas sanas, empezando por una distinta cada vez (round robin)."""
+    global _siguiente_replica
+    ahora = time.monotonic()
+    with _lock:
+        sanas = [r for r in REPLICAS if _expulsadas_hasta.get(_nombre(r), 0) <= ahora]
+        if not sanas:
+            return []
+        inicio = _siguiente_replica % len(sanas)
+        _siguiente_replica += 1
+    return sanas[inicio:] + sanas[:inicio]
+
+
+def nuevo_cliente() -> str:
+    """Id para un cliente que no ha enviado X-Cliente-Id."""
+    return uuid.uuid4().hex
+
+
+def marcar_escritura(cliente):
+    """Registra que el cliente acaba de escribir (read-your-writes)."""
+    if cliente is None:
+        return
+    ahora = time.monotonic()
+    with _lock:
+        _ultima_escritura[cliente] = ahora
+        if len(_ultima_escritura) > 10000:
+            for c, t in list(_ultima_escritura.items()):
+                if ahora - t > STICKY_SEGUNDOS:
+                    del _ultima_escritura[c]
+
+
+def _escribio_hace_poco(cliente) -> bool:
+    if cliente is None:
+        return False
+    with _lock:
+        t = _ultima_escritura.get(cliente)
+    return t is not None and time.monotonic() - t < STICKY_SEGUNDOS
+
+
+def get_db_lectura():
+    """Conexión para consultas de solo lectura.
+
+    Va a una réplica sana salvo que no haya ninguna o que el cliente haya
+    escrito hace poco, en cuyo caso va al primario para que vea sus cambios.
+    """
+    if not _escribio_hace_poco(cliente_actual.get()):
+        for replica in _replicas_disponibles():
+            try:
+                return _conectar(replica)
+            except mysql.connector.Error as e:
+                _expulsar(replica, str(e))
+    return get_db()
+
+
+def _retraso_replica(destino: dict):
+    """Segundos de retraso de la réplica, o None si no está replicando.
+
+    Una BD sin replicación configurada (p. ej. una BD local de pruebas)
+    se considera al día.
+    """
+    conn = _conectar(destino)
+    try:
+        cursor = conn.cursor(dictionary=True)
+        try:
+            cursor.execute("SHOW REPLICA STATUS")
+        except mysql.connector.Error:
+            # MySQL < 8.0.22 / MariaDB
+            cursor.execute("SHOW SLAVE STATUS")
+        estado = cursor.fetchone()
+        cursor.close()
+    finally:
+        conn.close()
+
+    if not estado:
+        return 0
+    retraso = estado.get("Seconds_Behind_Source", estado.get("Seconds_Behind_Master"))
+    return retraso
+
+
+def comprobar_replicas():
+    """Comprueba cada réplica y expulsa las caídas o con demasiado retraso."""
+    for replica in REPLICAS:
+        try:
+            retraso = _retraso_replica(replica)
+        except mysql.connector.Error as e:
+            _expulsar(replica, str(e))
+            continue
+        if retraso is None:
+            _expulsar(replica, "replicación parada")
+        elif retraso > MAX_RETRASO_SEGUNDOS:
+            _expulsar(replica, f"{retraso}s de retraso")
+        else:
+            with _lock:
+                _expulsadas_hasta.pop(_nombre(replica), None)
+
+
+def iniciar_comprobacion_replicas():
+    if not REPLICAS:
+        return
+    _parar_salud.clear()
+
+    def bucle():
+        while True:
+            comprobar_replicas()
+            if _parar_salud.wait(INTERVALO_SALUD_SEGUNDOS):
+                break
+
+    threading.Thread(target=bucle, name="db-salud-replicas", daemon=True).start()
+
+
+def detener_comprobacion_replicas():
+    _parar_salud.set()
@@ -0,0 +1,230 @@
+"""Sincronización incremental para la app (offline-first).
+
+Los handlers de consultes.py apuntan cada alta, cambio o baja de las tablas
+sincronizables en la tabla Cambios (migraciones/001_cambios.sql). GET /sync
+devuelve en NDJSON solo lo que ha cambiado desde el token del cliente, y al
+final el token nuevo. Los cambios se guardan RETENCION_DIAS; con un token
+más antiguo /sync responde 410 y la app tiene que volver a sincronizar sin
+`since`. Las filas van codificadas igual que en el resto de
+endpoints (jsonable_encoder: fechas ISO, DECIMAL como número).
+
+Formato de cada línea:
+    {"tabla": "Mascotas", "operacion": "upsert", "id": 3, "fila": {...}}
+    {"tabla": "Mascotas", "operacion": "delete", "id": 4}
+    {"token": "125"}
+"""
+import datetime
+import json
+import os
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+
+import jobs
+from db_connection import get_db
+
+router = APIRouter()
+
+TAMANO_LOTE = 500
+# Los cambios más recientes que esto no se entregan todavía: un id de
+# AUTO_INCREMENT puede hacerse visible después de otro mayor si su
+# transacción tarda más en hacer commit, y el cliente se lo saltaría.
+MARGEN_SEGUNDOS = 5
+RETENCION_DIAS = int(os.environ.get("PETMATCH_CAMBIOS_RETENCION_DIAS", "30"))
+
+# Tabla -> (columna id, columnas con los usuarios a los que afecta)
+# Sin columnas de usuario, la tabla se sincroniza entera con todos.
+TABLAS = {
+    "Categorias": ("id_categoria", ()),
+    "Productos": ("id_producto", ()),
+    "Mascotas": ("id_mascota", ("id_usuario",)),
+    "Mensajes": ("id_mensaje", ("id_emisor", "id_receptor")),
+}
+TABLAS_GLOBALES = [t for t, (_, usuarios) in TABLAS.items() if not usuarios]
+
+
+def registrar_cambios(cursor, tabla: str, ids: list, operacion: str):
+    """Apunta en Cambios las filas `ids` de `tabla`.
+
+    Lee la fila para saber a qué usuarios afecta, así que con "upsert" se
+    llama después del INSERT/UPDATE y con "delete" antes del DELETE, dentro
+    de la misma transacción.
+    """
+    if not ids:
+        return
+    columna_id, usuarios = TABLAS[tabla]
+    usuario_1 = usuarios[0] if len(usuarios) > 0 else "NULL"
+    usuario_2 = usuarios[1] if len(usuarios) > 1 else "NULL"
+    placeholders = ", ".join(["%s"] * len(ids))
+    query = f"""
+        INSERT INTO Cambios (tabla, id_fila, operacion, id_usuario, id_usuario_2)
+        SELECT %s, {columna_id}, %s, {usuario_1}, {usuario_2}
+        FROM {tabla} WHERE {columna_id} IN ({placeholders})
+    """
+    cursor.execute(query, (tabla, operacion, *ids))
+
+
+@jobs.handler("purgar_cambios")
+def _job_purgar_cambios(dias: int = RETENCION_DIAS):
+    """Borra en lotes los cambios de hace más de `dias` días.
+
+    El último cambio no se borra nunca: así MIN(id_cambio) sigue marcando
+    hasta dónde llega el historial aunque no haya habido cambios recientes.
+    """
+    conn = get_db()
+    if not conn:
+        raise RuntimeError("Error de conexión a la BD")
+    borrados = 0
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT COALESCE(MAX(id_cambio), 0) FROM Cambios")
+        (ultimo,) = cursor.fetchone()
+        while True:
+            cursor.execute(
+                "DELETE FROM Cambios WHERE id_cambio < %s "
+                "AND fecha < NOW() - INTERVAL %s DAY LIMIT %s",
+                (ultimo, dias, TAMANO_LOTE * 10)
+            )
+            conn.commit()
+            if cursor.rowcount == 0:
+                break
+            borrados += cursor.rowcount
+        cursor.close()
+    finally:
+        conn.close()
+    return {"borrados": borrados}
+
+
+def iniciar_purga():
+    """Purga Cambios una vez al día."""
+    jobs.programar("purgar_cambios", datetime.timedelta(days=1))
+
+
+def _linea(obj: dict) -> str:
+    return json.dumps(jsonable_encoder(obj), ensure_ascii=False) + "\n"
+
+
+def _filtro_usuario(tabla: str, id_usuario: int):
+    _, usuarios = TABLAS[tabla]
+    if not usuarios:
+        return "1 = 1", ()
+    return " OR ".join(f"{c} = %s" for c in usuarios), (id_usuario,) * len(usuarios)
+
+
+def _volcado_completo(cursor, id_usuario: int):
+    """Primera sincronización: todas las filas visibles para el usuario."""
+    for tabla, (columna_id, _) in TABLAS.items():
+        filtro, params = _filtro_usuario(tabla, id_usuario)
+        ultimo = 0
+        while True:
+            cursor.execute(
+                f"SELECT * FROM {tabla} WHERE ({filtro}) AND {columna_id} > %s "
+                f"ORDER BY {columna_id} LIMIT %s",
+                (*params, ultimo, TAMANO_LOTE)
+            )
+            filas = cursor.fetchall()
+            if not filas:
+                break
+            for fila in filas:
+                yield _linea({"tabla": tabla, "operacion": "upsert",
+                              "id": fila[columna_id], "fila": fila})
+            ultimo = filas[-1][columna_id]
+
+
+def _cambios_desde(cursor, desde: int, tope: int, id_usuario: int):
+    globales = ", ".join(["%s"] * len(TABLAS_GLOBALES))
+    while desde < tope:
+        cursor.execute(
+            f"""
+            SELECT id_cambio, tabla, id_fila, operacion FROM Cambios
+            WHERE id_cambio > %s AND id_cambio <= %s
+            AND (tabla IN ({globales}) OR id_usuario = %s OR id_usuario_2 = %s)
+            ORDER BY id_cambio
+            LIMIT %s
+            """,
+            (desde, tope, *TABLAS_GLOBALES, id_usuario, id_usuario, TAMANO_LOTE)
+        )
+        cambios = cursor.fetchall()
+        if not cambios:
+            break
+        desde = cambios[-1]["id_cambio"]
+
+        # Si una fila cambia varias veces en el lote solo cuenta la última
+        ultimos = {}
+        for cambio in cambios:
+            clave = (cambio["tabla"], cambio["id_fila"])
+            ultimos.pop(clave, None)
+            ultimos[clave] = cambio["operacion"]
+
+        # Las filas de los upsert se leen con una consulta por tabla
+        filas = {}
+        for tabla, (columna_id, _) in TABLAS.items():
+            ids = [i for (t, i), op in ultimos.items() if t == tabla and op == "upsert"]
+            if not ids:
+                continue
+            placeholders = ", ".join(["%s"] * len(ids))
+            cursor.execute(
+                f"SELECT * FROM {tabla} WHERE {columna_id} IN ({placeholders})", ids
+            )
+            for fila in cursor.fetchall():
+                filas[(tabla, fila[columna_id])] = fila
+
+        for (tabla, id_fila), operacion in ultimos.items():
+            if operacion == "delete":
+                yield _linea({"tabla": tabla, "operacion": "delete", "id": id_fila})
+            elif (tabla, id_fila) in filas:
+                # Si no está es que se borró después; ese delete llegará en otro lote
+                yield _linea({"tabla": tabla, "operacion": "upsert", "id": id_fila,
+                              "fila": filas[(tabla, id_fila)]})
+
+
+def _generar(conn, since: Optional[int], id_usuario: int):
+    try:
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute(
+            "SELECT COALESCE(MAX(id_cambio), 0) AS tope FROM Cambios "
+            "WHERE fecha <= NOW() - INTERVAL %s SECOND",
+            (MARGEN_SEGUNDOS,)
+        )
+        tope = cursor.fetchone()["tope"]
+        if since is None:
+            yield from _volcado_completo(cursor, id_usuario)
+        else:
+            tope = max(tope, since)
+            yield from _cambios_desde(cursor, since, tope, id_usuario)
+        cursor.close()
+        yield _linea({"token": str(tope)})
+    finally:
+        conn.close()
+
+
+@router.get("/sync")
+def sincronizar(id_usuario: int, since: Optional[int] = None):
+    """Categorias, Productos y las Mascotas y Mensajes del usuario que han
+    cambiado desde `since`. Sin `since` devuelve todo (primera sincronización).
+    Responde 410 si `since` es anterior a lo que queda en Cambios."""
+    # Siempre contra el primario: en una réplica con retraso un id de Cambios
+    # mayor puede verse antes que otro menor, el tope lo pasaría y el cliente
+    # no recibiría nunca ese cambio. MARGEN_SEGUNDOS solo cubre commits tardíos.
+    conn = get_db()
+    if not conn:
+        raise HTTPException(status_code=500, detail="Error de conexión a la BD")
+
+    if since is not None:
+        cursor = conn.cursor()
+        cursor.execute("SELECT MIN(id_cambio) FROM Cambios")
+        (primero,) = cursor.fetchone()
+        cursor.close()
+        # Los cambios entre since y el primero que queda ya se han purgado
+        if primero is not None and since < primero - 1:
+            conn.close()
+            raise HTTPException(
+                status_code=410,
+                detail="Token de sincronización caducado; sincroniza sin since"
+            )
+
+    return StreamingResponse(
+        _generar(conn, since, id_usuario), media_type="application/x-ndjson"
+    )
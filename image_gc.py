@@ -0,0 +1,164 @@
+"""Recolector de imágenes huérfanas de static/profiles y static/posts.
+
+Borra los ficheros que ya no referencia ninguna fila de Usuarios ni de
+Publicaciones (fotos sustituidas, subidas cuyo UPDATE falló...).
+
+Las referencias de la BD se guardan en un filtro de Bloom (~1,2 bytes por
+referencia con un 1% de falsos positivos) en vez de en un set. Un falso
+positivo solo hace que un huérfano no se borre en esa pasada; como la sal del
+filtro cambia en cada ejecución, la siguiente lo recoge. Nunca se borra un
+fichero referenciado.
+
+Uso manual:
+    python image_gc.py --dry-run
+    python image_gc.py --gracia 7200
+"""
+import argparse
+import datetime
+import hashlib
+import math
+import os
+import time
+
+import jobs
+from consultes import POST_IMAGES_DIR, PROFILE_IMAGES_DIR
+from db_connection import get_db
+
+TAMANO_LOTE = 1000
+FALSOS_POSITIVOS = 0.01
+# Un fichero más reciente que esto puede ser una subida cuyo UPDATE aún no ha llegado
+GRACIA_SEGUNDOS = int(os.environ.get("PETMATCH_GC_GRACIA", "3600"))
+INTERVALO_HORAS = float(os.environ.get("PETMATCH_GC_INTERVALO_HORAS", "24"))
+
+# (directorio, tabla, columna) de cada grupo de imágenes
+ORIGENES = [
+    (PROFILE_IMAGES_DIR, "Usuarios", "foto_usuario"),
+    (POST_IMAGES_DIR, "Publicaciones", "foto_publicacion"),
+]
+
+
+class _FiltroBloom:
+    def __init__(self, elementos: int, falsos_positivos: float = FALSOS_POSITIVOS):
+        elementos = max(1, elementos)
+        self.bits = max(1024, math.ceil(-elementos * math.log(falsos_positivos) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.bits / elementos * math.log(2)))
+        self._tabla = bytearray(self.bits // 8 + 1)
+        self._sal = os.urandom(16)
+
+    def _posiciones(self, filename: str):
+        nombre = os.path.basename(filename).encode()
+        digest = hashlib.blake2b(nombre, digest_size=16, key=self._sal).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % self.bits
+
+    def add(self, filename: str):
+        for pos in self._posiciones(filename):
+            self._tabla[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, filename: str) -> bool:
+        return all(self._tabla[pos >> 3] & (1 << (pos & 7)) for pos in self._posiciones(filename))
+
+
+def _contar_referencias(conn, tabla: str, columna: str) -> int:
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT COUNT(*) FROM {tabla} WHERE {columna} IS NOT NULL")
+    (total,) = cursor.fetchone()
+    cursor.close()
+    return total
+
+
+def _referencias(conn, tabla: str, columna: str):
+    """Lee las imágenes referenciadas en lotes con un cursor sin buffer."""
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT {columna} FROM {tabla} WHERE {columna} IS NOT NULL")
+    while True:
+        filas = cursor.fetchmany(TAMANO_LOTE)
+        if not filas:
+            break
+        for (filename,) in filas:
+            if filename:
+                yield filename
+    cursor.close()
+
+
+def _recolectar_directorio(directorio, referenciadas, limite_mtime, dry_run):
+    informe = {"revisados": 0, "huerfanos": 0, "bytes_liberados": 0}
+    if not os.path.isdir(directorio):
+        return informe
+
+    # os.scandir va devolviendo las entradas sin cargar el listado entero
+    with os.scandir(directorio) as entradas:
+        for entrada in entradas:
+            if not entrada.is_file(follow_symlinks=False):
+                continue
+            informe["revisados"] += 1
+            if entrada.name in referenciadas:
+                continue
+            stat = entrada.stat(follow_symlinks=False)
+            if stat.st_mtime > limite_mtime:
+                continue
+
+            informe["huerfanos"] += 1
+            if dry_run:
+                informe["bytes_liberados"] += stat.st_size
+                continue
+            try:
+                os.remove(entrada.path)
+            except FileNotFoundError:
+                continue
+            informe["bytes_liberados"] += stat.st_size
+    return informe
+
+
+def recolectar(gracia: int = GRACIA_SEGUNDOS, dry_run: bool = False) -> dict:
+    """Borra las imágenes huérfanas y devuelve un informe por directorio."""
+    conn = get_db()
+    if not conn:
+        # Sin referencias no se puede saber qué sobra: mejor no borrar nada
+        raise RuntimeError("Error de conexión a la BD")
+
+    # El límite se fija antes de leer la BD para no tocar subidas posteriores
+    limite_mtime = time.time() - gracia
+    informe = {"dry_run": dry_run}
+    try:
+        for directorio, tabla, columna in ORIGENES:
+            referenciadas = _FiltroBloom(_contar_referencias(conn, tabla, columna))
+            for filename in _referencias(conn, tabla, columna):
+                referenciadas.add(filename)
+            informe[tabla] = _recolectar_directorio(
+                directorio, referenciadas, limite_mtime, dry_run
+            )
+            del referenciadas
+    finally:
+        conn.close()
+
+    informe["bytes_liberados"] = sum(
+        informe[tabla]["bytes_liberados"] for _, tabla, _ in ORIGENES
+    )
+    print(f"🧹 GC de imágenes: {informe['bytes_liberados']} bytes liberados")
+    return informe
+
+
+@jobs.handler("gc_imagenes")
+def _job_gc_imagenes(gracia: int = GRACIA_SEGUNDOS):
+    return recolectar(gracia=gracia)
+
+
+def iniciar_programacion(intervalo_horas: float = INTERVALO_HORAS):
+    """Encola un trabajo gc_imagenes cada `intervalo_horas` horas, contando
+    desde el último que hay en el diario de jobs (al arrancar si no hay ninguno)."""
+    if intervalo_horas <= 0:
+        return
+    jobs.programar("gc_imagenes", datetime.timedelta(hours=intervalo_horas))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Borra imágenes huérfanas de static/")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="solo informa de lo que se borraría")
+    parser.add_argument("--gracia", type=int, default=GRACIA_SEGUNDOS,
+                        help="no toca ficheros más recientes que estos segundos")
+    args = parser.parse_args()
+    print(recolectar(gracia=args.gracia, dry_run=args.dry_run))
@@ -0,0 +1,260 @@
+"""Cola de trabajos en segundo plano.
+
+Cada cambio de estado se añade como una línea JSON a un diario para que los
+trabajos sobrevivan a un reinicio del servidor: al arrancar se vuelven a
+encolar los que no habían terminado. De vez en cuando el diario se compacta
+(una línea por trabajo vivo) y se olvidan los trabajos terminados antiguos.
+Los handlers tienen que ser idempotentes porque un trabajo puede ejecutarse
+más de una vez (reintentos o caída a mitad de ejecución).
+"""
+import datetime
+import json
+import os
+import queue
+import threading
+import traceback
+import uuid
+from typing import Optional
+
+JOBS_FILE = os.environ.get(
+    "PETMATCH_JOBS_FILE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "jobs.jsonl")
+)
+NUM_WORKERS = int(os.environ.get("PETMATCH_JOBS_WORKERS", "2"))
+MAX_INTENTOS = 5
+# Los trabajos terminados se olvidan en la primera compactación pasado este tiempo
+RETENCION = datetime.timedelta(days=7)
+# Se compacta al pasar de este número de líneas (o del doble de trabajos vivos)
+# y, aunque no haya tráfico, como mínimo con esta frecuencia
+COMPACTAR_CADA_LINEAS = 1000
+COMPACTAR_CADA = datetime.timedelta(hours=1)
+
+_handlers = {}
+_trabajos = {}
+_lock = threading.Lock()
+_cola = queue.Queue()
+_workers = []
+_parar = threading.Event()
+_diario = None
+_lineas_diario = 0
+_ultima_compactacion = datetime.datetime.min
+
+
+def handler(tipo: str):
+    """Registra la función que ejecuta los trabajos de un tipo."""
+    def decorador(func):
+        _handlers[tipo] = func
+        return func
+    return decorador
+
+
+def _ahora() -> str:
+    return datetime.datetime.now().isoformat(timespec="seconds")
+
+
+def _escribir(trabajo: dict):
+    """Añade el estado actual del trabajo al diario. Se llama con _lock adquirido."""
+    global _diario, _lineas_diario
+    if _diario is None:
+        _diario = open(JOBS_FILE, "a", encoding="utf-8")
+    _diario.write(json.dumps(trabajo, ensure_ascii=False) + "\n")
+    _diario.flush()
+    _lineas_diario += 1
+    if _lineas_diario >= max(COMPACTAR_CADA_LINEAS, 2 * len(_trabajos)):
+        _compactar()
+
+
+def _compactar():
+    """Olvida los trabajos terminados antiguos y reescribe el diario con una
+    línea por trabajo. Se llama con _lock adquirido."""
+    global _diario, _lineas_diario, _ultima_compactacion
+    limite = (datetime.datetime.now() - RETENCION).isoformat(timespec="seconds")
+    for id_trabajo, trabajo in list(_trabajos.items()):
+        if trabajo["estado"] in ("completado", "fallido") and trabajo["actualizado"] < limite:
+            del _trabajos[id_trabajo]
+
+    if _diario is not None:
+        _diario.close()
+    tmp = JOBS_FILE + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        for trabajo in _trabajos.values():
+            f.write(json.dumps(trabajo, ensure_ascii=False) + "\n")
+    os.replace(tmp, JOBS_FILE)
+    _diario = open(JOBS_FILE, "a", encoding="utf-8")
+    _lineas_diario = len(_trabajos)
+    _ultima_compactacion = datetime.datetime.now()
+
+
+def _compactar_si_toca():
+    with _lock:
+        if datetime.datetime.now() - _ultima_compactacion >= COMPACTAR_CADA:
+            _compactar()
+
+
+def _cargar():
+    trabajos = {}
+    if os.path.exists(JOBS_FILE):
+        try:
+            with open(JOBS_FILE, encoding="utf-8") as f:
+                for linea in f:
+                    try:
+                        trabajo = json.loads(linea)
+                    except ValueError:
+                        # Última línea a medias si el servidor cayó escribiendo
+                        continue
+                    # Manda la última línea de cada trabajo
+                    trabajos[trabajo["id_trabajo"]] = trabajo
+        except OSError as e:
+            print(f"❌ Error al leer {JOBS_FILE}: {e}")
+            return
+
+    with _lock:
+        for trabajo in trabajos.values():
+            if trabajo["estado"] not in ("completado", "fallido"):
+                # Si el servidor cayó con el trabajo en curso se vuelve a lanzar
+                trabajo["estado"] = "pendiente"
+                _cola.put(trabajo["id_trabajo"])
+            _trabajos[trabajo["id_trabajo"]] = trabajo
+        _compactar()
+
+
+def encolar(tipo: str, payload: dict) -> str:
+    """Guarda un trabajo nuevo y devuelve su id."""
+    if tipo not in _handlers:
+        raise ValueError(f"Tipo de trabajo desconocido: {tipo}")
+
+    id_trabajo = str(uuid.uuid4())
+    with _lock:
+        _trabajos[id_trabajo] = {
+            "id_trabajo": id_trabajo,
+            "tipo": tipo,
+            "payload": payload,
+            "estado": "pendiente",
+            "intentos": 0,
+            "error": None,
+            "resultado": None,
+            "creado": _ahora(),
+            "actualizado": _ahora(),
+        }
+        _escribir(_trabajos[id_trabajo])
+    _cola.put(id_trabajo)
+    return id_trabajo
+
+
+def obtener_trabajo(id_trabajo: str) -> Optional[dict]:
+    with _lock:
+        trabajo = _trabajos.get(id_trabajo)
+        return dict(trabajo) if trabajo else None
+
+
+def ultima_ejecucion(tipo: str) -> Optional[datetime.datetime]:
+    """Fecha del trabajo más reciente de ese tipo que sigue en el diario."""
+    with _lock:
+        fechas = [t["creado"] for t in _trabajos.values() if t["tipo"] == tipo]
+    return datetime.datetime.fromisoformat(max(fechas)) if fechas else None
+
+
+def programar(tipo: str, intervalo: datetime.timedelta, payload: Optional[dict] = None):
+    """Encola `tipo` cada `intervalo`, contando desde la última vez que se
+    encoló (según el diario), no desde el arranque: si el servidor se reinicia
+    más a menudo que `intervalo` el trabajo sigue ejecutándose."""
+    def bucle():
+        while True:
+            ultima = ultima_ejecucion(tipo)
+            espera = 0.0
+            if ultima is not None:
+                espera = max(0.0, (ultima + intervalo - datetime.datetime.now()).total_seconds())
+            if esperar_parada(espera):
+                return
+            # Otro hilo o un reinicio puede haberlo encolado mientras se esperaba
+            ultima = ultima_ejecucion(tipo)
+            if ultima is None or datetime.datetime.now() - ultima >= intervalo:
+                encolar(tipo, payload or {})
+
+    hilo = threading.Thread(target=bucle, name=f"programa-{tipo}", daemon=True)
+    hilo.start()
+    return hilo
+
+
+def _actualizar(id_trabajo: str, **campos):
+    with _lock:
+        trabajo = _trabajos[id_trabajo]
+        trabajo.update(campos)
+        trabajo["actualizado"] = _ahora()
+        _escribir(trabajo)
+        return dict(trabajo)
+
+
+def _reencolar(id_trabajo: str):
+    if not _parar.is_set():
+        _cola.put(id_trabajo)
+
+
+def _ejecutar(id_trabajo: str):
+    trabajo = obtener_trabajo(id_trabajo)
+    if not trabajo or trabajo["estado"] != "pendiente":
+        return
+
+    trabajo = _actualizar(
+        id_trabajo, estado="en_curso", intentos=trabajo["intentos"] + 1
+    )
+    try:
+        resultado = _handlers[trabajo["tipo"]](**trabajo["payload"])
+    except Exception as e:
+        traceback.print_exc()
+        if trabajo["intentos"] >= MAX_INTENTOS:
+            _actualizar(id_trabajo, estado="fallido", error=str(e))
+            print(f"❌ Trabajo {id_trabajo} fallido tras {trabajo['intentos']} intentos")
+            return
+        _actualizar(id_trabajo, estado="pendiente", error=str(e))
+        # Backoff exponencial: 2, 4, 8, 16... segundos
+        espera = 2 ** trabajo["intentos"]
+        temporizador = threading.Timer(espera, _reencolar, args=(id_trabajo,))
+        temporizador.daemon = True
+        temporizador.start()
+        return
+
+    _actualizar(id_trabajo, estado="completado", error=None, resultado=resultado)
+
+
+def _worker():
+    while not _parar.is_set():
+        try:
+            id_trabajo = _cola.get(timeout=1)
+        except queue.Empty:
+            _compactar_si_toca()
+            continue
+        try:
+            _ejecutar(id_trabajo)
+        finally:
+            _cola.task_done()
+
+
+def iniciar(num_workers: int = NUM_WORKERS):
+    """Carga los trabajos guardados y arranca los workers."""
+    if _workers:
+        return
+    _parar.clear()
+    _cargar()
+    for i in range(num_workers):
+        hilo = threading.Thread(target=_worker, name=f"jobs-worker-{i}", daemon=True)
+        hilo.start()
+        _workers.append(hilo)
+
+
+def esperar_parada(segundos: float) -> bool:
+    """Espera hasta `segundos`; devuelve True si mientras tanto se ha llamado a detener()."""
+    return _parar.wait(segundos)
+
+
+def detener():
+    """Para los workers. Lo que quede pendiente se retoma en el próximo arranque."""
+    global _diario
+    _parar.set()
+    for hilo in _workers:
+        hilo.join(timeout=5)
+    _workers.clear()
+    with _lock:
+        if _diario is not None:
+            _diario.close()
+            _diario = None
@@ -1,13 +1,56 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from consultes import router as router_consultes
+from delta_sync import router as router_sync
 from fastapi.staticfiles import StaticFiles
+import admission
+import db_connection
+import delta_sync
+import image_gc
+import jobs
 
 app = FastAPI()
 
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
-# Incluir las rutas de consultes.py
+# Las lecturas van a las réplicas salvo que el cliente acabe de escribir.
+# El cliente se identifica con X-Cliente-Id; si escribe sin él se le da uno
+# en la respuesta para que lo reenvíe. La IP no sirve: detrás del balanceador
+# o de un NAT la comparten muchos usuarios.
+@app.middleware("http")
+async def enrutar_bd(request: Request, call_next):
+    cliente = request.headers.get("X-Cliente-Id")
+    escritura = request.method not in ("GET", "HEAD", "OPTIONS")
+    if not cliente and escritura:
+        cliente = db_connection.nuevo_cliente()
+    token = db_connection.cliente_actual.set(cliente)
+    try:
+        response = await call_next(request)
+    finally:
+        db_connection.cliente_actual.reset(token)
+    if escritura:
+        db_connection.marcar_escritura(cliente)
+        response.headers["X-Cliente-Id"] = cliente
+    return response
+
+# Va después para quedar por fuera: las peticiones rechazadas no llegan a tocar la BD
+app.middleware("http")(admission.controlar_admision)
+
+# Incluir las rutas de consultes.py y delta_sync.py
 app.include_router(router_consultes)
+app.include_router(router_sync)
+
+# Hilos en segundo plano: salud de réplicas y cola de trabajos
+@app.on_event("startup")
+def iniciar_trabajos():
+    db_connection.iniciar_comprobacion_replicas()
+    jobs.iniciar()
+    image_gc.iniciar_programacion()
+    delta_sync.iniciar_purga()
+
+@app.on_event("shutdown")
+def detener_trabajos():
+    jobs.detener()
+    db_connection.detener_comprobacion_replicas()
 
 @app.get("/")
 def home():
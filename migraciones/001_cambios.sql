@@ -0,0 +1,15 @@
+-- Registro de cambios para GET /sync (delta_sync.py).
+-- Aplicar antes de desplegar la versión que lo usa:
+--     mysql -h <host> -u <usuario_admin> -p PetMatch < migraciones/001_cambios.sql
+
+CREATE TABLE IF NOT EXISTS Cambios (
+    id_cambio BIGINT AUTO_INCREMENT PRIMARY KEY,
+    tabla VARCHAR(32) NOT NULL,
+    id_fila INT NOT NULL,
+    operacion ENUM('upsert', 'delete') NOT NULL,
+    id_usuario INT NULL,
+    id_usuario_2 INT NULL,
+    fecha DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_cambios_usuario (id_usuario, id_cambio),
+    INDEX idx_cambios_usuario_2 (id_usuario_2, id_cambio)
+);